@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Audio Common - Helpers shared by normalize_audio.py and verify_audio.py
+
+Terminal colors, the ffmpeg location, file scanning and loudnorm report parsing
+live here so both scripts stay in step.
+
+Scanning a source tree is cached in ~/.cache/audio_normalizer/scan.json so that
+running the normalizer and then the verifier doesn't walk the same directories
+twice. The cache stores the modification time of every directory it scanned;
+adding, removing or renaming a file anywhere in the tree changes one of them
+and triggers a fresh scan.
+"""
+
+import os
+import re
+import json
+import shutil
+import collections
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+__all__ = [
+    'Colors', 'AUDIO_EXTENSIONS', 'FFMPEG', 'FFPROBE', 'MINIMAL_ENV',
+    'find_audio_files', 'lookup_file', 'ffmpeg_thread_args',
+    'run_stderr_tail', 'parse_loudnorm_stderr',
+]
+
+# ANSI color codes for terminal output
+class Colors:
+    GREEN = '\033[92m'
+    YELLOW = '\033[93m'
+    RED = '\033[91m'
+    BLUE = '\033[94m'
+    CYAN = '\033[96m'
+    RESET = '\033[0m'
+    BOLD = '\033[1m'
+
+# Input formats ffmpeg can read that we treat as audio
+AUDIO_EXTENSIONS = frozenset({'.mp3', '.m4a', '.mp4', '.wav', '.flac', '.aac', '.ogg', '.wma'})
+
+# Resolve ffmpeg once instead of searching PATH on every spawn
+FFMPEG = shutil.which('ffmpeg') or 'ffmpeg'
+FFPROBE = shutil.which('ffprobe') or 'ffprobe'
+
+# Only pass what ffmpeg needs; copying the full environment slows process creation.
+# SYSTEMROOT is required for child processes to start on Windows, and the library
+# paths for ffmpeg builds installed under a custom prefix or by a module system
+_ENV_KEYS = ('PATH', 'LANG', 'SYSTEMROOT',
+             'LD_LIBRARY_PATH', 'DYLD_LIBRARY_PATH', 'DYLD_FALLBACK_LIBRARY_PATH')
+MINIMAL_ENV = {key: os.environ[key] for key in _ENV_KEYS if key in os.environ}
+
+# The loudnorm report is a flat JSON object containing "input_i"
+_LOUDNORM_JSON_RE = re.compile(r'\{[^{}]*?"input_i"[^{}]*?\}', re.DOTALL)
+
+CACHE_PATH = Path.home() / '.cache' / 'audio_normalizer' / 'scan.json'
+
+def _walk_audio_files(directory: str, dir_mtimes: Dict):
+    """Yield audio files under directory using os.scandir (one syscall per directory)"""
+    try:
+        dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+        it = os.scandir(directory)
+    except OSError:
+        return  # Unreadable directory; skip it like os.walk does
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_audio_files(entry.path, dir_mtimes)
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                yield Path(entry.path)
+
+def _load_cache() -> Dict:
+    """Load the scan cache, or start a new one if missing or corrupt"""
+    try:
+        with open(CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache: Dict):
+    """Write the scan cache atomically; a failed write only costs a rescan next time"""
+    try:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = CACHE_PATH.with_name(CACHE_PATH.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError:
+        pass
+
+def _is_cache_valid(entry: Dict) -> bool:
+    """Check that no scanned directory has changed since the entry was written"""
+    try:
+        return all(os.stat(directory).st_mtime_ns == mtime
+                   for directory, mtime in entry['dir_mtimes'].items())
+    except (OSError, KeyError, AttributeError):
+        return False
+
+def find_audio_files(directory: Path, use_cache: bool = True) -> List[Path]:
+    """Find all audio files in directory recursively"""
+    directory = Path(directory)
+    key = str(directory.resolve())
+
+    if use_cache:
+        entry = _load_cache().get(key)
+        if entry and _is_cache_valid(entry):
+            return [directory / relative for relative in entry['files']]
+
+    dir_mtimes = {}
+    relative_files = sorted(f.relative_to(key) for f in _walk_audio_files(key, dir_mtimes))
+
+    if use_cache:
+        cache = _load_cache()  # Re-read in case the other script updated it meanwhile
+        cache[key] = {
+            'dir_mtimes': dir_mtimes,
+            'files': [str(relative) for relative in relative_files],
+        }
+        _save_cache(cache)
+    return [directory / relative for relative in relative_files]
+
+def run_stderr_tail(cmd: List[str], max_lines: int = 256) -> str:
+    """Run ffmpeg and return only the last lines of its stderr.
+
+    The reports we parse are printed at the very end, so a bounded deque keeps
+    memory constant no matter how long the file is.
+    """
+    tail = collections.deque(maxlen=max_lines)
+    # close_fds=False (with an absolute FFMPEG path) lets subprocess use posix_spawn
+    with subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                          bufsize=1, close_fds=False, env=MINIMAL_ENV) as proc:
+        for line in proc.stderr:
+            tail.append(line)
+    return ''.join(tail)
+
+def parse_loudnorm_stderr(stderr: str) -> Optional[Dict]:
+    """Extract the loudnorm JSON block printed at the end of ffmpeg's stderr"""
+    match = _LOUDNORM_JSON_RE.search(stderr)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(0))
+    except ValueError:
+        return None
+
+def ffmpeg_thread_args(single_thread: bool) -> List[str]:
+    """ffmpeg options pinning a stage to one thread when files run in parallel.
+
+    Applied to both the input (decoder) and the output (filters/encoder) so N
+    workers use N cores instead of N processes each spawning a thread per core.
+    """
+    return ['-threads', '1'] if single_thread else []
+
+def lookup_file(directory: Path, file_path: str) -> Optional[Path]:
+    """Return directory / file_path with a single stat if it names a file in directory"""
+    relative = Path(file_path)
+    if relative.is_absolute() or '..' in relative.parts:
+        return None  # Only plain relative paths can be looked up directly
+    candidate = directory / relative
+    return candidate if candidate.is_file() else None
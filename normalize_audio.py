@@ -5,7 +5,22 @@ Audio Normalizer - Normalize MP3 files to broadcast standard loudness levels
 This script normalizes all MP3 files in the /mp3s directory to -16 LUFS,
 preserving the folder structure in the /normalized directory.
 
-Usage: python3 normalize_audio.py
+Usage: python3 normalize_audio.py [--jobs N] [--single-pass] [--fast-batch] [--no-cache] [file]
+
+  --jobs N       Number of files to process in parallel (default: CPU count)
+  --single-pass  Skip the analysis pass and normalize in one ffmpeg call.
+                 Roughly halves processing time, but loudness lands within
+                 about 1 LUFS of the target instead of matching it exactly.
+  --fast-batch   Normalize all files with the same codec, sample rate and
+                 channels in one long-running ffmpeg process instead of one
+                 process per file. Implies --single-pass. One loudnorm runs
+                 across file boundaries, so its gain carries over from the
+                 end of one file into the first seconds of the next. Only
+                 worth it for many short files, where process startup
+                 dominates. Any group whose cuts don't line up falls back to
+                 per-file processing.
+  --no-cache     Rescan the source directory instead of reusing the scan
+                 cached in ~/.cache/audio_normalizer.
 """
 
 # ASCII Art for DFW Chinese Youth Camp
@@ -25,27 +40,59 @@ ASCII_LOGO = """
 
 import os
 import sys
+import re
+import csv
 import json
+import hashlib
+import collections
 import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import shutil
 
-# ANSI color codes for terminal output
-class Colors:
-    GREEN = '\033[92m'
-    YELLOW = '\033[93m'
-    RED = '\033[91m'
-    BLUE = '\033[94m'
-    CYAN = '\033[96m'
-    RESET = '\033[0m'
-    BOLD = '\033[1m'
+try:
+    from tqdm import tqdm
+except ImportError:  # Progress bar is optional; fall back to plain [n/total] lines
+    tqdm = None
+
+from audio_common import *
 
 # Target loudness parameters (broadcast standard)
 TARGET_LUFS = -16.0
 TARGET_LRA = 7.0
 TARGET_TP = -1.0
 
+# MP3 sources already this close to target are copied instead of re-encoded
+COPY_TOLERANCE = 0.3
+
+# Fast batch outputs must be within this many seconds of their source's length
+SEGMENT_TOLERANCE = 0.1
+
+# ebur128 summary fields (printed once at the end of the run)
+_EBUR128_I_RE = re.compile(r'Integrated loudness:\s+I:\s+(-?[\d.]+|-?inf) LUFS\s+Threshold:\s+(-?[\d.]+|-?inf) LUFS')
+_EBUR128_LRA_RE = re.compile(r'LRA:\s+(-?[\d.]+|-?inf) LU\b')
+_EBUR128_PEAK_RE = re.compile(r'True peak:\s+Peak:\s+(-?[\d.]+|-?inf) dBFS')
+
+# Serializes output from worker threads so per-file blocks don't interleave
+print_lock = threading.Lock()
+
+def write_message(message: str):
+    """Print from a worker thread; goes through tqdm so an active bar is redrawn below it"""
+    with print_lock:
+        (tqdm.write if tqdm else print)(message)
+
+# Records which inputs (and target settings) produced each output, so re-runs
+# skip only outputs that are still up to date
+MANIFEST_NAME = '.normalize_manifest.json'
+manifest_lock = threading.Lock()
+
+# Normalization modes from least to most accurate. An output made in a more
+# accurate mode also counts as up to date for a run asking for a less accurate one
+MODES = ('fast-batch', 'single-pass', 'two-pass')
+
 def print_header():
     """Print script header"""
     print(f"{Colors.CYAN}{ASCII_LOGO}{Colors.RESET}")
@@ -54,16 +101,6 @@ def print_header():
     print(f"Target: {TARGET_LUFS} LUFS (Broadcast Standard)")
     print(f"{'='*50}\n")
 
-def find_audio_files(source_dir: Path) -> List[Path]:
-    """Find all audio files in the source directory recursively"""
-    audio_extensions = {'.mp3', '.m4a', '.mp4', '.wav', '.flac', '.aac', '.ogg', '.wma'}
-    audio_files = []
-    for root, dirs, files in os.walk(source_dir):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in audio_extensions):
-                audio_files.append(Path(root) / file)
-    return sorted(audio_files)
-
 def create_output_path(source_file: Path, source_dir: Path, output_dir: Path) -> Path:
     """Create the output path maintaining folder structure, converting to .mp3"""
     relative_path = source_file.relative_to(source_dir)
@@ -72,53 +109,93 @@ def create_output_path(source_file: Path, source_dir: Path, output_dir: Path) ->
     output_path.parent.mkdir(parents=True, exist_ok=True)
     return output_path
 
-def analyze_loudness(input_file: Path) -> Dict:
-    """First pass: Analyze audio loudness using ffmpeg"""
+def dedupe_output_paths(audio_files: List[Path], source_dir: Path) -> Tuple[List[Path], Dict[Path, Path]]:
+    """Keep one input per output path, since every output is renamed to .mp3.
+
+    Sources like song.mp3 and song.wav in the same folder would otherwise be
+    encoded at the same time into the same file. The MP3 source wins, then the
+    first by path, so the same input is kept on every run. Returns the inputs
+    to process and a {dropped input: kept input} map.
+    """
+    kept = {}
+    dropped = {}
+    ordered = sorted(audio_files, key=lambda f: (f.suffix.lower() != '.mp3', f))
+    for input_file in ordered:
+        key = os.path.normcase(input_file.relative_to(source_dir).with_suffix('.mp3'))
+        if key in kept:
+            dropped[input_file] = kept[key]
+        else:
+            kept[key] = input_file
+    return [f for f in audio_files if f not in dropped], dropped
+
+def _parse_ebur128_summary(stderr: str) -> Dict:
+    """Map the ebur128 summary block onto the loudnorm-style keys normalize_audio expects"""
+    tail = stderr[stderr.rfind('Summary:'):]
+    integrated = _EBUR128_I_RE.search(tail)
+    lra = _EBUR128_LRA_RE.search(tail)
+    peak = _EBUR128_PEAK_RE.search(tail)
+    if not (integrated and lra and peak):
+        return None
+    
+    def clamp(value: str) -> str:
+        # loudnorm rejects measured values below -99 (e.g. -inf for silence)
+        return f"{max(float(value), -99.0):.2f}"
+    
+    return {
+        'input_i': clamp(integrated.group(1)),
+        'input_tp': clamp(peak.group(1)),
+        'input_lra': clamp(lra.group(1)),
+        'input_thresh': clamp(integrated.group(2)),
+    }
+
+def analyze_loudness(input_file: Path, single_thread: bool = False) -> Dict:
+    """First pass: Measure loudness with ebur128 (much faster than a loudnorm pass)"""
     cmd = [
-        'ffmpeg', '-i', str(input_file),
-        '-af', f'loudnorm=I={TARGET_LUFS}:TP={TARGET_TP}:LRA={TARGET_LRA}:print_format=json',
+        FFMPEG, '-nostats', *ffmpeg_thread_args(single_thread), '-i', str(input_file),
+        # framelog=verbose keeps per-frame measurements out of stderr at the default log level
+        '-af', 'ebur128=peak=true:framelog=verbose',
+        *ffmpeg_thread_args(single_thread),
         '-f', 'null', '-'
     ]
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        
-        # Extract JSON from stderr
-        stderr_lines = result.stderr.split('\n')
-        json_start = None
-        json_data = []
-        
-        for i, line in enumerate(stderr_lines):
-            if '{' in line and json_start is None:
-                json_start = i
-            if json_start is not None:
-                json_data.append(line)
-            if '}' in line and json_start is not None:
-                break
-        
-        if json_data:
-            json_str = '\n'.join(json_data)
-            # Extract just the JSON part
-            json_str = json_str[json_str.find('{'):json_str.rfind('}')+1]
-            return json.loads(json_str)
-        else:
-            return None
+        return _parse_ebur128_summary(run_stderr_tail(cmd))
             
     except Exception as e:
-        print(f"{Colors.RED}Error analyzing {input_file}: {e}{Colors.RESET}")
+        write_message(f"{Colors.RED}Error analyzing {input_file}: {e}{Colors.RESET}")
         return None
 
-def normalize_audio(input_file: Path, output_file: Path, loudness_data: Dict) -> bool:
-    """Second pass: Apply normalization based on analysis"""
+def is_within_target(loudness_data: Dict) -> bool:
+    """Check whether measured loudness is close enough to target to leave as-is"""
+    try:
+        return (abs(float(loudness_data['input_i']) - TARGET_LUFS) < COPY_TOLERANCE
+                and float(loudness_data['input_tp']) <= TARGET_TP)
+    except (KeyError, TypeError, ValueError):
+        return False
+
+def normalize_audio(input_file: Path, output_file: Path, loudness_data: Dict,
+                    single_thread: bool = False,
+                    on_progress: Optional[Callable[[float], None]] = None) -> bool:
+    """Second pass: Apply normalization based on analysis.
+
+    on_progress, if given, is called with the number of seconds encoded so far.
+    """
+    # Encode to a temp file and rename on success, so an interrupted run never
+    # leaves a truncated output that looks finished
+    tmp_file = output_file.with_suffix(output_file.suffix + '.tmp')
+    
     if not loudness_data:
         # Fallback to single-pass if analysis failed
         cmd = [
-            'ffmpeg', '-i', str(input_file),
+            FFMPEG, '-v', 'error', '-nostats', '-progress', 'pipe:1',
+            *ffmpeg_thread_args(single_thread), '-i', str(input_file),
             '-af', f'loudnorm=I={TARGET_LUFS}:TP={TARGET_TP}:LRA={TARGET_LRA}',
             '-ar', '44100',  # Standard sample rate
             '-b:a', '192k',  # Good quality bitrate
             '-y',  # Overwrite output
-            str(output_file)
+            *ffmpeg_thread_args(single_thread),
+            '-f', 'mp3',  # Format can't be inferred from the .tmp extension
+            str(tmp_file)
         ]
     else:
         # Two-pass normalization with measured values
@@ -129,7 +206,8 @@ def normalize_audio(input_file: Path, output_file: Path, loudness_data: Dict) ->
         target_offset = loudness_data.get('target_offset', '0.0')
         
         cmd = [
-            'ffmpeg', '-i', str(input_file),
+            FFMPEG, '-v', 'error', '-nostats', '-progress', 'pipe:1',
+            *ffmpeg_thread_args(single_thread), '-i', str(input_file),
             '-af', f'loudnorm=I={TARGET_LUFS}:TP={TARGET_TP}:LRA={TARGET_LRA}:'
                    f'measured_I={measured_i}:measured_TP={measured_tp}:'
                    f'measured_LRA={measured_lra}:measured_thresh={measured_thresh}:'
@@ -137,29 +215,419 @@ def normalize_audio(input_file: Path, output_file: Path, loudness_data: Dict) ->
             '-ar', '44100',
             '-b:a', '192k',
             '-y',
-            str(output_file)
+            *ffmpeg_thread_args(single_thread),
+            '-f', 'mp3',  # Format can't be inferred from the .tmp extension
+            str(tmp_file)
         ]
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        # -progress writes key=value lines to stdout. Even at -v error, ffmpeg logs
+        # decode problems to stderr (and may still exit 0), so stderr is drained
+        # on its own thread into a bounded tail; otherwise a full pipe would block
+        # ffmpeg while we wait on stdout
+        stderr_tail = collections.deque(maxlen=64)
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                              close_fds=False, env=MINIMAL_ENV) as proc:
+            drain = threading.Thread(target=stderr_tail.extend, args=(proc.stderr,), daemon=True)
+            drain.start()
+            for line in proc.stdout:
+                key, _, value = line.partition('=')
+                # out_time_ms is in microseconds despite its name (kept for older ffmpeg)
+                if on_progress and key == 'out_time_ms' and value.strip().isdigit():
+                    on_progress(int(value) / 1_000_000)
+            drain.join()
+        stderr = ''.join(stderr_tail)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+        os.replace(tmp_file, output_file)
         return True
     except subprocess.CalledProcessError as e:
-        print(f"{Colors.RED}Error normalizing {input_file}: {e}{Colors.RESET}")
+        # stderr is only looked at when ffmpeg fails; its last line holds the reason
+        reason = e.stderr.strip().splitlines()[-1] if e.stderr and e.stderr.strip() else e
+        write_message(f"{Colors.RED}Error normalizing {input_file}: {reason}{Colors.RESET}")
+        return False
+    except OSError as e:
+        # ffmpeg couldn't start, or the output is locked (e.g. open in a player on Windows)
+        write_message(f"{Colors.RED}Error normalizing {input_file}: {e}{Colors.RESET}")
         return False
+    finally:
+        tmp_file.unlink(missing_ok=True)  # Only still there if ffmpeg or the rename failed
 
-def format_progress(current: int, total: int, filename: str) -> str:
-    """Format progress indicator"""
-    percentage = (current / total) * 100
-    progress_bar_length = 30
-    filled_length = int(progress_bar_length * current // total)
-    bar = '█' * filled_length + '░' * (progress_bar_length - filled_length)
+def load_manifest(manifest_path: Path) -> Dict:
+    """Load the normalization manifest, or start a new one if missing or corrupt"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest: Dict, manifest_path: Path):
+    """Write the manifest atomically so an interrupted run never leaves it half-written"""
+    tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def _output_fingerprint(output_file: Path) -> str:
+    """SHA-1 of the first 4 KB of the output, enough to notice a replaced file"""
+    with open(output_file, 'rb') as f:
+        return hashlib.sha1(f.read(4096)).hexdigest()
+
+def _manifest_entry(input_file: Path) -> Dict:
+    """Describe the input and target settings that an output was produced from"""
+    stat = os.stat(input_file)
+    return {
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'target_lufs': TARGET_LUFS,
+        'target_tp': TARGET_TP,
+        'target_lra': TARGET_LRA,
+    }
+
+def is_up_to_date(input_file: Path, output_file: Path, entry: Dict, mode: str) -> bool:
+    """Check whether output_file was produced from the current input and targets
+    in a mode at least as accurate as mode"""
+    if not entry or not output_file.exists():
+        return False
+    if entry.get('mode') not in MODES or MODES.index(entry['mode']) < MODES.index(mode):
+        return False
+    expected = _manifest_entry(input_file)
+    if any(entry.get(key) != value for key, value in expected.items()):
+        return False
+    try:
+        return entry.get('output_sha1_first_4k') == _output_fingerprint(output_file)
+    except OSError:
+        return False
+
+def remove_stale_temp_files(output_dir: Path) -> int:
+    """Delete temp files and fast-batch work directories left by a killed run.
+
+    Only names this script creates are matched: outputs mirror the source
+    folder layout, so a folder the user happened to name "*.tmp" is left alone.
+    """
+    removed = 0
+    for work_dir in output_dir.glob('.fast-batch-*.tmp'):
+        if work_dir.is_dir() and not work_dir.is_symlink():
+            shutil.rmtree(work_dir, ignore_errors=True)
+            removed += 1
+    tmp_files = [*output_dir.rglob('*.mp3.tmp'), output_dir / (MANIFEST_NAME + '.tmp')]
+    for tmp_file in tmp_files:
+        if tmp_file.is_file():
+            try:
+                tmp_file.unlink()
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+def record_output(manifest: Dict, input_file: Path, source_dir: Path,
+                  output_file: Path, output_dir: Path, mode: str):
+    """Add a freshly written output, and the mode that produced it, to the manifest and save it.
+
+    Failures only warn: the output itself is fine, and at worst it gets
+    normalized again on the next run.
+    """
+    try:
+        entry = _manifest_entry(input_file)
+        entry['mode'] = mode
+        entry['output_sha1_first_4k'] = _output_fingerprint(output_file)
+        with manifest_lock:
+            manifest[input_file.relative_to(source_dir).as_posix()] = entry
+            save_manifest(manifest, output_dir / MANIFEST_NAME)
+    except OSError as e:
+        write_message(f"{Colors.YELLOW}Warning: could not update {MANIFEST_NAME} for {input_file}: {e}{Colors.RESET}")
+
+def _probe_audio(input_file: Path) -> Dict:
+    """Read codec, sample rate, channels and duration of a file's first audio stream.
+
+    The stream's own duration is preferred over the container's, which for
+    video files covers the longest stream rather than the audio. 'estimated'
+    is set when ffprobe had to guess the duration from the bitrate (e.g. VBR
+    MP3 without a Xing header), which it only reports as a warning.
+    """
+    cmd = [
+        FFPROBE, '-v', 'warning', '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name,sample_rate,channels,channel_layout,duration:format=duration',
+        '-of', 'json', str(input_file)
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, check=True, close_fds=False, env=MINIMAL_ENV)
+    info = json.loads(result.stdout)
+    stream = info['streams'][0]
+    duration = stream.get('duration')
+    if duration in (None, 'N/A'):
+        duration = info['format']['duration']
+    return {
+        'codec': stream['codec_name'],
+        'sample_rate': stream['sample_rate'],
+        'channels': stream['channels'],
+        'channel_layout': stream.get('channel_layout', ''),
+        'duration': float(duration),
+        'estimated': 'Estimating duration from bitrate' in result.stderr,
+    }
+
+def _normalize_batch(batch: List[Path], durations: List[float],
+                     source_dir: Path, output_dir: Path,
+                     single_thread: bool = False) -> List[Path]:
+    """Single-pass normalize a batch of identically-encoded files in one ffmpeg process.
+
+    The inputs are joined with the concat demuxer, run through one loudnorm
+    filter, and cut back apart with the segment muxer at each file's duration.
+    loudnorm retimes its output from the samples it actually decoded, so the
+    segment muxer's list of start and end times is checked against the
+    durations before anything is moved into place. A batch whose decoded
+    length doesn't match fails as a whole instead of writing the wrong audio
+    to an output.
+
+    Returns the inputs whose outputs were moved into place, which is empty if
+    the batch failed.
+    """
+    # The .tmp suffix lets remove_stale_temp_files clean it up after a crash
+    with tempfile.TemporaryDirectory(prefix='.fast-batch-', suffix='.tmp', dir=output_dir) as work_dir:
+        work_dir = Path(work_dir)
+        list_file = work_dir / 'inputs.txt'
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for input_file, duration in zip(batch, durations):
+                escaped = str(input_file.resolve()).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+                f.write(f"duration {duration:.6f}\n")
+        
+        # Cut points are the cumulative durations between consecutive files
+        cut_points = []
+        elapsed = 0.0
+        for duration in durations[:-1]:
+            elapsed += duration
+            cut_points.append(f'{elapsed:.6f}')
+        
+        cmd = [
+            FFMPEG, '-v', 'error', '-nostats', *ffmpeg_thread_args(single_thread),
+            '-f', 'concat', '-safe', '0', '-i', str(list_file),
+            '-filter_complex', f'[0:a]loudnorm=I={TARGET_LUFS}:TP={TARGET_TP}:LRA={TARGET_LRA}[a]',
+            '-map', '[a]',
+            '-ar', '44100',
+            '-b:a', '192k',
+            *ffmpeg_thread_args(single_thread),
+            '-f', 'segment', '-segment_format', 'mp3', '-reset_timestamps', '1',
+        ]
+        if cut_points:
+            cmd += ['-segment_times', ','.join(cut_points)]
+        segment_list = work_dir / 'segments.csv'
+        cmd += ['-segment_list', str(segment_list), '-segment_list_type', 'csv']
+        cmd.append(str(work_dir / 'out_%05d.mp3'))
+        
+        try:
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                           text=True, check=True, close_fds=False, env=MINIMAL_ENV)
+        except (OSError, subprocess.CalledProcessError):
+            return []
+        
+        # Rows are filename,start,end; the last end is the decoded length of the
+        # whole batch, so if any declared duration was off the last segment
+        # absorbs the difference and fails the check
+        try:
+            with open(segment_list, 'r', encoding='utf-8', newline='') as f:
+                rows = list(csv.reader(f))
+            segments = [work_dir / row[0] for row in rows]
+            lengths = [float(row[2]) - float(row[1]) for row in rows]
+        except (OSError, ValueError, IndexError):
+            return []
+        if len(segments) != len(batch):
+            return []  # Cuts didn't line up with the inputs; don't guess
+        if any(abs(length - duration) > SEGMENT_TOLERANCE
+               for length, duration in zip(lengths, durations)):
+            return []
+        
+        # An output that can't be replaced (e.g. locked on Windows) is left for
+        # the per-file path; the rest still get recorded
+        moved = []
+        for input_file, segment in zip(batch, segments):
+            try:
+                os.replace(segment, create_output_path(input_file, source_dir, output_dir))
+            except OSError:
+                continue
+            moved.append(input_file)
+    return moved
+
+def _try_probe_audio(input_file: Path) -> Optional[Dict]:
+    """_probe_audio, or None if ffprobe is missing or can't read the file"""
+    try:
+        return _probe_audio(input_file)
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError):
+        return None
+
+def run_fast_batch(audio_files: List[Path], source_dir: Path, output_dir: Path,
+                   manifest: Dict, jobs: int = 1) -> List[Path]:
+    """Normalize files one ffmpeg process per audio format; returns the files that succeeded.
+
+    The concat demuxer needs every input to share codec, sample rate and
+    channel layout, so files are grouped by what ffprobe reports for them.
+    Files that can't be probed, files whose duration ffprobe only estimated
+    (their cut would land in the wrong place while every segment still
+    matches its declared length) and groups that fail are left for the
+    regular per-file path. Probes and groups both run up to jobs at a time.
+    """
+    normalized = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        batches = {}
+        for input_file, info in zip(audio_files, executor.map(_try_probe_audio, audio_files)):
+            if info is None or info['estimated']:
+                continue
+            key = (info['codec'], info['sample_rate'], info['channels'], info['channel_layout'])
+            batches.setdefault(key, []).append((input_file, info['duration']))
+        
+        single_thread = min(jobs, len(batches)) > 1
+        futures = {}
+        for key, entries in sorted(batches.items()):
+            batch = [input_file for input_file, _ in entries]
+            durations = [duration for _, duration in entries]
+            future = executor.submit(_normalize_batch, batch, durations,
+                                     source_dir, output_dir, single_thread)
+            futures[future] = (key, batch)
+        
+        for future in as_completed(futures):
+            (codec, sample_rate, channels, _), batch = futures[future]
+            moved = future.result()
+            for input_file in moved:
+                record_output(manifest, input_file, source_dir,
+                              create_output_path(input_file, source_dir, output_dir), output_dir,
+                              'fast-batch')
+            normalized.extend(moved)
+            label = (f"  {Colors.CYAN}↳ Batch of {len(batch)} {codec} files "
+                     f"({sample_rate} Hz, {channels} ch){Colors.RESET}")
+            if len(moved) == len(batch):
+                print(f"{label} {Colors.GREEN}✓ Done{Colors.RESET}")
+            elif moved:
+                print(f"{label} {Colors.YELLOW}{len(batch) - len(moved)} output(s) couldn't be written; "
+                      f"retrying them per file{Colors.RESET}")
+            else:
+                print(f"{label} {Colors.YELLOW}Falling back to per-file mode{Colors.RESET}")
+    return normalized
+
+def file_progress(label: str) -> Tuple[Callable[[float], None], Callable[[], None]]:
+    """Return (update, close) callbacks that show one file's encoding progress.
+
+    ffmpeg's progress output doesn't include the input length, so this shows
+    seconds encoded rather than a percentage (probing for it would cost an
+    extra process per file).
+    """
+    if tqdm:
+        bar = tqdm(unit='s', desc=label, leave=False)
+        
+        def update(seconds: float):
+            bar.update(round(seconds, 1) - bar.n)
+        return update, bar.close
+    
+    def update(seconds: float):
+        with print_lock:
+            print(f"\r  {Colors.CYAN}↳ Normalizing... {seconds:.0f}s encoded{Colors.RESET}", end='', flush=True)
+    
+    def close():
+        with print_lock:
+            print('\r\033[K', end='', flush=True)  # Clear the line for the summary
+    return update, close
+
+def process_one(input_file: Path, source_dir: Path, output_dir: Path,
+                manifest: Dict, single_thread: bool = False,
+                mode: str = 'two-pass',
+                show_progress: bool = False) -> Tuple[str, Path, List[str]]:
+    """Analyze and normalize a single file.
+
+    mode is the least accurate result the run accepts (see MODES); anything
+    but 'two-pass' skips the analysis pass.
+
+    Returns (status, relative_path, messages) where status is one of
+    'success', 'failed' or 'skipped'. Messages are returned rather than
+    printed so parallel workers don't interleave their output.
+    """
+    relative_path = input_file.relative_to(source_dir)
+    messages = []
+    
+    # Create output path
+    output_file = create_output_path(input_file, source_dir, output_dir)
+    
+    # Skip only if the output was made from this exact input with the current targets
+    with manifest_lock:
+        entry = manifest.get(relative_path.as_posix())
+    if is_up_to_date(input_file, output_file, entry, mode):
+        messages.append(f"  {Colors.BLUE}↷ Already normalized, skipping...{Colors.RESET}")
+        return 'skipped', relative_path, messages
+    
+    # First pass: Analyze (skipped in single-pass mode)
+    if mode != 'two-pass':
+        loudness_data = None
+    else:
+        loudness_data = analyze_loudness(input_file, single_thread)
+        
+        if loudness_data:
+            current_lufs = float(loudness_data.get('input_i', '-99'))
+            messages.append(f"  {Colors.CYAN}↳ Analyzing loudness...{Colors.RESET} "
+                            f"Current: {Colors.YELLOW}{current_lufs:.1f} LUFS{Colors.RESET}")
+        else:
+            messages.append(f"  {Colors.CYAN}↳ Analyzing loudness...{Colors.RESET} "
+                            f"{Colors.YELLOW}Using single-pass mode{Colors.RESET}")
+    
+    # Already on target: copy the MP3 as-is, skipping the encoder and generation loss
+    if loudness_data and input_file.suffix.lower() == '.mp3' and is_within_target(loudness_data):
+        tmp_file = output_file.with_suffix(output_file.suffix + '.tmp')
+        try:
+            shutil.copyfile(input_file, tmp_file)
+            os.replace(tmp_file, output_file)
+        except OSError as e:
+            tmp_file.unlink(missing_ok=True)
+            messages.append(f"  {Colors.CYAN}↳ Copying...{Colors.RESET} {Colors.RED}✗ Failed: {e}{Colors.RESET}")
+            return 'failed', relative_path, messages
+        record_output(manifest, input_file, source_dir, output_file, output_dir, 'two-pass')
+        messages.append(f"  {Colors.CYAN}↳ Already at target, copied without re-encoding{Colors.RESET} "
+                        f"{Colors.GREEN}✓ Done{Colors.RESET}")
+        return 'success', relative_path, messages
     
-    return (f"{Colors.YELLOW}[{current}/{total}]{Colors.RESET} "
-            f"{Colors.BLUE}[{bar}]{Colors.RESET} "
-            f"{percentage:3.0f}% - {filename}")
+    # Second pass: Normalize (with live progress when files run one at a time)
+    update, close = file_progress(str(relative_path)) if show_progress else (None, None)
+    try:
+        normalized = normalize_audio(input_file, output_file, loudness_data, single_thread, update)
+    finally:
+        if close:
+            close()
+    if normalized:
+        # A failed analysis falls back to single-pass; record that so a later run retries it
+        record_output(manifest, input_file, source_dir, output_file, output_dir,
+                      'two-pass' if loudness_data else 'single-pass')
+        messages.append(f"  {Colors.CYAN}↳ Normalizing...{Colors.RESET} {Colors.GREEN}✓ Done{Colors.RESET}")
+        return 'success', relative_path, messages
+    else:
+        messages.append(f"  {Colors.CYAN}↳ Normalizing...{Colors.RESET} {Colors.RED}✗ Failed{Colors.RESET}")
+        return 'failed', relative_path, messages
 
 def main():
     """Main function"""
+    # Check for --jobs flag (defaults to one worker per CPU core)
+    jobs = os.cpu_count() or 1
+    if '--jobs' in sys.argv:
+        idx = sys.argv.index('--jobs')
+        try:
+            jobs = max(1, int(sys.argv[idx + 1]))
+        except (IndexError, ValueError):
+            print(f"{Colors.RED}Error: --jobs requires a positive integer!{Colors.RESET}")
+            sys.exit(1)
+        del sys.argv[idx:idx + 2]  # Remove flag from argv for file processing
+    
+    # Check for --single-pass flag (faster, slightly less accurate loudness)
+    single_pass = '--single-pass' in sys.argv
+    if single_pass:
+        sys.argv.remove('--single-pass')
+    
+    # Check for --fast-batch flag (one ffmpeg process per format; implies --single-pass)
+    fast_batch = '--fast-batch' in sys.argv
+    if fast_batch:
+        sys.argv.remove('--fast-batch')
+        single_pass = True
+    
+    # Check for --no-cache flag (always rescan the source directory)
+    use_cache = '--no-cache' not in sys.argv
+    if not use_cache:
+        sys.argv.remove('--no-cache')
+    
     print_header()
     
     # Define directories
@@ -176,18 +644,19 @@ def main():
     if len(sys.argv) > 1:
         # Single file mode
         file_path = sys.argv[1]
-        audio_extensions = {'.mp3', '.m4a', '.mp4', '.wav', '.flac', '.aac', '.ogg', '.wma'}
-        if not any(file_path.lower().endswith(ext) for ext in audio_extensions):
+        if os.path.splitext(file_path)[1].lower() not in AUDIO_EXTENSIONS:
             print(f"{Colors.RED}Error: File must be an audio file (mp3, m4a, mp4, etc.)!{Colors.RESET}")
             sys.exit(1)
         
-        # Find the file in source directory
-        audio_files = []
-        for root, dirs, files in os.walk(source_dir):
-            for file in files:
-                if file == os.path.basename(file_path) or str(Path(root) / file).endswith(file_path):
-                    audio_files.append(Path(root) / file)
-                    break
+        # Find the file in source directory: try the path as given, then search by name
+        candidate = lookup_file(source_dir, file_path)
+        audio_files = [candidate] if candidate else []
+        if not audio_files:
+            for root, dirs, files in os.walk(source_dir):
+                for file in files:
+                    if file == os.path.basename(file_path) or str(Path(root) / file).endswith(file_path):
+                        audio_files.append(Path(root) / file)
+                        break
         
         if not audio_files:
             print(f"{Colors.RED}Error: File '{file_path}' not found in {source_dir}!{Colors.RESET}")
@@ -197,7 +666,7 @@ def main():
     else:
         # Find all audio files
         print(f"{Colors.CYAN}Scanning for audio files...{Colors.RESET}")
-        audio_files = find_audio_files(source_dir)
+        audio_files = find_audio_files(source_dir, use_cache)
     
     if not audio_files:
         print(f"{Colors.YELLOW}No audio files found in '{source_dir}'!{Colors.RESET}")
@@ -205,45 +674,81 @@ def main():
     
     print(f"Found {Colors.GREEN}{len(audio_files)}{Colors.RESET} audio files\n")
     
-    # Process each file
     successful = 0
     failed = 0
     skipped = 0
     
-    for i, input_file in enumerate(audio_files, 1):
-        relative_path = input_file.relative_to(source_dir)
-        print(format_progress(i, len(audio_files), str(relative_path)))
-        
-        # Create output path
-        output_file = create_output_path(input_file, source_dir, output_dir)
-        
-        # Check if output file already exists
-        if output_file.exists():
-            print(f"  {Colors.BLUE}↷ Already normalized, skipping...{Colors.RESET}")
-            skipped += 1
-            print()  # Empty line between files
-            continue
-        
-        # First pass: Analyze
-        print(f"  {Colors.CYAN}↳ Analyzing loudness...{Colors.RESET}", end='', flush=True)
-        loudness_data = analyze_loudness(input_file)
-        
-        if loudness_data:
-            current_lufs = float(loudness_data.get('input_i', '-99'))
-            print(f" Current: {Colors.YELLOW}{current_lufs:.1f} LUFS{Colors.RESET}")
-        else:
-            print(f" {Colors.YELLOW}Using single-pass mode{Colors.RESET}")
-        
-        # Second pass: Normalize
-        print(f"  {Colors.CYAN}↳ Normalizing...{Colors.RESET}", end='', flush=True)
-        if normalize_audio(input_file, output_file, loudness_data):
-            print(f" {Colors.GREEN}✓ Done{Colors.RESET}")
-            successful += 1
-        else:
-            print(f" {Colors.RED}✗ Failed{Colors.RESET}")
-            failed += 1
-        
-        print()  # Empty line between files
+    audio_files, duplicates = dedupe_output_paths(audio_files, source_dir)
+    for dropped, kept in sorted(duplicates.items()):
+        print(f"{Colors.YELLOW}{dropped.relative_to(source_dir)}{Colors.RESET}")
+        print(f"  {Colors.RED}✗ Skipped: same output as {kept.relative_to(source_dir)}{Colors.RESET}\n")
+    failed += len(duplicates)
+    
+    mode = 'fast-batch' if fast_batch else 'single-pass' if single_pass else 'two-pass'
+    if single_pass:
+        print(f"{Colors.YELLOW}Single-pass mode: skipping analysis (loudness accurate to ~1 LUFS){Colors.RESET}\n")
+    
+    output_dir.mkdir(parents=True, exist_ok=True)
+    removed = remove_stale_temp_files(output_dir)
+    if removed:
+        print(f"{Colors.YELLOW}Removed {removed} incomplete file(s) from an interrupted run{Colors.RESET}\n")
+    manifest = load_manifest(output_dir / MANIFEST_NAME)
+    
+    # Fast batch: hand everything that needs work to one ffmpeg per format first
+    pending = audio_files
+    if fast_batch:
+        outdated = [
+            f for f in audio_files
+            if not is_up_to_date(f, create_output_path(f, source_dir, output_dir),
+                                 manifest.get(f.relative_to(source_dir).as_posix()), mode)
+        ]
+        if outdated:
+            print(f"{Colors.CYAN}Fast batch mode: {len(outdated)} files to normalize{Colors.RESET}")
+            batched = set(run_fast_batch(outdated, source_dir, output_dir, manifest, jobs))
+            successful += len(batched)
+            pending = [f for f in audio_files if f not in batched]
+            print()
+    
+    # Process remaining files in parallel; each ffmpeg call is an independent subprocess
+    jobs = max(1, min(jobs, len(pending)))
+    single_thread = jobs > 1
+    # Per-file progress only makes sense when one file is encoding at a time
+    show_progress = not single_thread and sys.stdout.isatty()
+    if single_thread:
+        print(f"Processing with {Colors.GREEN}{jobs}{Colors.RESET} parallel jobs\n")
+    
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(process_one, input_file, source_dir, output_dir,
+                            manifest, single_thread, mode, show_progress)
+            for input_file in pending
+        ]
+        # One shared bar; tqdm throttles redraws instead of rendering per file
+        progress = tqdm(total=len(pending), unit='file') if tqdm else None
+        emit = progress.write if progress else print
+        for i, future in enumerate(as_completed(futures), 1):
+            status, relative_path, messages = future.result()
+            
+            with print_lock:
+                if progress:
+                    emit(f"{Colors.YELLOW}{relative_path}{Colors.RESET}")
+                else:
+                    emit(f"{Colors.YELLOW}[{i}/{len(pending)}]{Colors.RESET} {relative_path}")
+                for message in messages:
+                    emit(message)
+                emit('')  # Empty line between files
+                if progress:
+                    progress.update(1)
+                    progress.set_postfix_str(str(relative_path))
+            
+            if status == 'success':
+                successful += 1
+            elif status == 'skipped':
+                skipped += 1
+            else:
+                failed += 1
+        if progress:
+            progress.close()
     
     # Print summary
     print(f"\n{Colors.CYAN}{'='*50}{Colors.RESET}")
@@ -253,7 +758,7 @@ def main():
         print(f"  {Colors.BLUE}↷ Skipped (already normalized): {skipped}{Colors.RESET}")
     if failed > 0:
         print(f"  {Colors.RED}✗ Failed: {failed}{Colors.RESET}")
-    print(f"  Total files: {len(audio_files)}")
+    print(f"  Total files: {len(audio_files) + len(duplicates)}")
     print(f"\nNormalized files saved to: {Colors.BLUE}{output_dir}{Colors.RESET}")
     print(f"{Colors.CYAN}{'='*50}{Colors.RESET}\n")
 
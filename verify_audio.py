@@ -5,25 +5,18 @@ Audio Verification - Verify normalized audio files meet broadcast standards
 This script checks that all normalized files are properly normalized to -16 LUFS
 and ensures no files are missing or have quality issues.
 
-Usage: python3 verify_audio.py
+Usage: python3 verify_audio.py [--source] [--jobs N] [--no-cache] [file]
 """
 
 import os
 import sys
-import json
-import subprocess
+import glob
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from typing import Dict, List, Tuple
 
-# ANSI color codes for terminal output
-class Colors:
-    GREEN = '\033[92m'
-    YELLOW = '\033[93m'
-    RED = '\033[91m'
-    BLUE = '\033[94m'
-    CYAN = '\033[96m'
-    RESET = '\033[0m'
-    BOLD = '\033[1m'
+from audio_common import *
 
 # Target parameters with tolerance
 TARGET_LUFS = -16.0
@@ -40,51 +33,24 @@ def print_header(check_source=False):
         print(f"Checking normalized files against broadcast standards")
     print(f"{'='*50}\n")
 
-def find_audio_files(directory: Path) -> List[Path]:
-    """Find all audio files in directory recursively"""
-    audio_extensions = {'.mp3', '.m4a', '.mp4', '.wav', '.flac', '.aac', '.ogg', '.wma'}
-    audio_files = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in audio_extensions):
-                audio_files.append(Path(root) / file)
-    return sorted(audio_files)
-
-def analyze_file(file_path: Path) -> Dict:
+def analyze_file(file_path: Path, single_thread: bool = False) -> Dict:
     """Analyze audio file and return loudness data"""
     cmd = [
-        'ffmpeg', '-i', str(file_path),
+        FFMPEG, '-nostats', *ffmpeg_thread_args(single_thread), '-i', str(file_path),
         '-af', 'loudnorm=print_format=json',
+        *ffmpeg_thread_args(single_thread),
         '-f', 'null', '-'
     ]
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        
-        # Extract JSON from stderr
-        stderr_lines = result.stderr.split('\n')
-        json_start = None
-        json_data = []
-        
-        for i, line in enumerate(stderr_lines):
-            if '{' in line and json_start is None:
-                json_start = i
-            if json_start is not None:
-                json_data.append(line)
-            if '}' in line and json_start is not None:
-                break
-        
-        if json_data:
-            json_str = '\n'.join(json_data)
-            json_str = json_str[json_str.find('{'):json_str.rfind('}')+1]
-            data = json.loads(json_str)
-            return {
-                'lufs': float(data.get('input_i', '-99')),
-                'peak': float(data.get('input_tp', '-99')),
-                'lra': float(data.get('input_lra', '0'))
-            }
-        else:
+        data = parse_loudnorm_stderr(run_stderr_tail(cmd))
+        if data is None:
             return None
+        return {
+            'lufs': float(data.get('input_i', '-99')),
+            'peak': float(data.get('input_tp', '-99')),
+            'lra': float(data.get('input_lra', '0'))
+        }
             
     except Exception as e:
         return None
@@ -109,6 +75,12 @@ def check_file_compliance(loudness_data: Dict) -> Tuple[bool, List[str]]:
     
     return len(issues) == 0, issues
 
+def _check(file_path: Path, single_thread: bool = False) -> Tuple[Path, Dict, bool, List[str]]:
+    """Analyze one file and check it against the targets (runs in a worker thread)"""
+    loudness_data = analyze_file(file_path, single_thread)
+    is_compliant, issues = check_file_compliance(loudness_data)
+    return file_path, loudness_data, is_compliant, issues
+
 def main():
     """Main function"""
     # Check for --source flag
@@ -116,6 +88,22 @@ def main():
     if check_source:
         sys.argv.remove('--source')  # Remove flag from argv for file processing
     
+    # Check for --jobs flag (defaults to one worker per CPU core)
+    jobs = os.cpu_count() or 1
+    if '--jobs' in sys.argv:
+        idx = sys.argv.index('--jobs')
+        try:
+            jobs = max(1, int(sys.argv[idx + 1]))
+        except (IndexError, ValueError):
+            print(f"{Colors.RED}Error: --jobs requires a positive integer!{Colors.RESET}")
+            sys.exit(1)
+        del sys.argv[idx:idx + 2]
+    
+    # Check for --no-cache flag (always rescan directories)
+    use_cache = '--no-cache' not in sys.argv
+    if not use_cache:
+        sys.argv.remove('--no-cache')
+    
     print_header(check_source)
     
     # Define directories
@@ -138,29 +126,28 @@ def main():
     if len(sys.argv) > 1:
         # Single file mode
         file_path = sys.argv[1]
-        audio_extensions = {'.mp3', '.m4a', '.mp4', '.wav', '.flac', '.aac', '.ogg', '.wma'}
-        if not any(file_path.lower().endswith(ext) for ext in audio_extensions):
+        if os.path.splitext(file_path)[1].lower() not in AUDIO_EXTENSIONS:
             print(f"{Colors.RED}Error: File must be an audio file (mp3, m4a, mp4, etc.)!{Colors.RESET}")
             sys.exit(1)
         
-        # Find the file in target directory
-        target_files = []
-        # Look for the file with .mp3 extension (since all outputs are mp3)
+        # Find the file in target directory: try the path as given, then search by name
         if check_source:
-            # For source files, look for exact match
-            for root, dirs, files in os.walk(target_dir):
-                for file in files:
-                    if file == os.path.basename(file_path) or str(Path(root) / file).endswith(file_path):
-                        target_files.append(Path(root) / file)
-                        break
+            candidate = lookup_file(target_dir, file_path)
         else:
-            # For normalized files, look for .mp3 version
-            search_name = Path(file_path).stem + '.mp3'
-            for root, dirs, files in os.walk(target_dir):
-                for file in files:
-                    if file == search_name or file == os.path.basename(file_path) or str(Path(root) / file).endswith(file_path):
-                        target_files.append(Path(root) / file)
-                        break
+            # Normalized outputs are always .mp3
+            candidate = (lookup_file(target_dir, str(Path(file_path).with_suffix('.mp3')))
+                         or lookup_file(target_dir, file_path))
+        if not candidate:
+            # Search by name, stopping at the first match (glob.escape: titles often contain [ ])
+            search_names = [os.path.basename(file_path)]
+            if not check_source:
+                # For normalized files, look for the .mp3 version first
+                search_names.insert(0, Path(file_path).stem + '.mp3')
+            for search_name in search_names:
+                candidate = next(target_dir.rglob(glob.escape(search_name)), None)
+                if candidate:
+                    break
+        target_files = [candidate] if candidate else []
         
         if not target_files:
             print(f"{Colors.RED}Error: File '{file_path}' not found in {target_dir}!{Colors.RESET}")
@@ -173,11 +160,11 @@ def main():
         # Find files in directories
         print(f"{Colors.CYAN}Scanning {dir_name} directory...{Colors.RESET}")
         if check_source:
-            normalized_files = find_audio_files(source_dir)
+            normalized_files = find_audio_files(source_dir, use_cache)
             source_files = []  # No comparison when checking source
         else:
-            source_files = find_audio_files(source_dir) if source_dir.exists() else []
-            normalized_files = find_audio_files(normalized_dir)
+            source_files = find_audio_files(source_dir, use_cache) if source_dir.exists() else []
+            normalized_files = find_audio_files(normalized_dir, use_cache)
     
     # Check file counts
     if check_source:
@@ -197,31 +184,32 @@ def main():
     non_compliant_files = []
     failed_files = []
     
-    for i, file_path in enumerate(normalized_files, 1):
-        relative_path = file_path.relative_to(target_dir)
-        print(f"{Colors.YELLOW}[{i}/{len(normalized_files)}]{Colors.RESET} {relative_path}")
+    # Analyze in parallel (read-only, so no contention); map() keeps results in order
+    jobs = min(jobs, len(normalized_files))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(partial(_check, single_thread=jobs > 1), normalized_files)
         
-        # Analyze file
-        loudness_data = analyze_file(file_path)
-        is_compliant, issues = check_file_compliance(loudness_data)
-        
-        if loudness_data is None:
-            print(f"  {Colors.RED}✗ Failed to analyze{Colors.RESET}")
-            failed_files.append(str(relative_path))
-        elif is_compliant:
-            lufs = loudness_data['lufs']
-            peak = loudness_data['peak']
-            print(f"  {Colors.GREEN}✓{Colors.RESET} LUFS: {Colors.GREEN}{lufs:.1f}{Colors.RESET} (target: {TARGET_LUFS}±{LUFS_TOLERANCE}) | Peak: {Colors.GREEN}{peak:.1f}{Colors.RESET} dBTP")
-            compliant_files += 1
-        else:
-            lufs = loudness_data['lufs']
-            peak = loudness_data['peak']
-            print(f"  {Colors.RED}✗{Colors.RESET} LUFS: {Colors.RED}{lufs:.1f}{Colors.RESET} (target: {TARGET_LUFS}±{LUFS_TOLERANCE}) | Peak: {Colors.RED if peak > TARGET_TP else Colors.YELLOW}{peak:.1f}{Colors.RESET} dBTP")
-            for issue in issues:
-                print(f"    {Colors.YELLOW}→ {issue}{Colors.RESET}")
-            non_compliant_files.append((str(relative_path), issues, loudness_data))
-        
-        print()  # Empty line between files
+        for i, (file_path, loudness_data, is_compliant, issues) in enumerate(results, 1):
+            relative_path = file_path.relative_to(target_dir)
+            print(f"{Colors.YELLOW}[{i}/{len(normalized_files)}]{Colors.RESET} {relative_path}")
+            
+            if loudness_data is None:
+                print(f"  {Colors.RED}✗ Failed to analyze{Colors.RESET}")
+                failed_files.append(str(relative_path))
+            elif is_compliant:
+                lufs = loudness_data['lufs']
+                peak = loudness_data['peak']
+                print(f"  {Colors.GREEN}✓{Colors.RESET} LUFS: {Colors.GREEN}{lufs:.1f}{Colors.RESET} (target: {TARGET_LUFS}±{LUFS_TOLERANCE}) | Peak: {Colors.GREEN}{peak:.1f}{Colors.RESET} dBTP")
+                compliant_files += 1
+            else:
+                lufs = loudness_data['lufs']
+                peak = loudness_data['peak']
+                print(f"  {Colors.RED}✗{Colors.RESET} LUFS: {Colors.RED}{lufs:.1f}{Colors.RESET} (target: {TARGET_LUFS}±{LUFS_TOLERANCE}) | Peak: {Colors.RED if peak > TARGET_TP else Colors.YELLOW}{peak:.1f}{Colors.RESET} dBTP")
+                for issue in issues:
+                    print(f"    {Colors.YELLOW}→ {issue}{Colors.RESET}")
+                non_compliant_files.append((str(relative_path), issues, loudness_data))
+            
+            print()  # Empty line between files
     
     # Print summary
     print(f"{Colors.CYAN}{'='*50}{Colors.RESET}")